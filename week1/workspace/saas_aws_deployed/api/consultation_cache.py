@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+
+class _InFlight:
+    """A single generation that any number of identical requests can follow"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.cacheable = True
+        self.followers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def follow(self) -> AsyncIterator[str]:
+        # Every follower replays from the start, so late joiners see the full output
+        position = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: position < len(self.chunks) or self.done)
+                pending = self.chunks[position:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position == len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class ConsultationCache:
+    """Per-user idempotency cache for consultation summaries.
+
+    Completed outputs are kept encrypted in memory for a short TTL, and
+    duplicate submissions that arrive mid-generation attach to the running
+    generation instead of starting a new one. State is per process.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 1000, key: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Without a configured key, results are only readable by this process
+        self._fernet = Fernet(key.encode() if key else Fernet.generate_key())
+        self._entries: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    @staticmethod
+    def make_key(user_id: str, user_prompt: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(user_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(user_prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, token = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        try:
+            return json.loads(self._fernet.decrypt(token))
+        except InvalidToken:
+            logger.error("Discarding consultation cache entry that failed to decrypt")
+            del self._entries[key]
+            return None
+
+    def put(self, key: str, chunks: List[str]):
+        token = self._fernet.encrypt(json.dumps(chunks).encode("utf-8"))
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, token)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        """Forget a stored or in-flight result so the next request regenerates it"""
+        self._entries.pop(key, None)
+        flight = self._in_flight.pop(key, None)
+        if flight is not None:
+            # Current followers still get its output, but it is never stored
+            flight.cacheable = False
+            self._cancel_if_abandoned(flight)
+
+    @staticmethod
+    def _cancel_if_abandoned(flight: _InFlight):
+        # A discarded generation nobody is reading is just paying for tokens; stop it upstream
+        if not flight.cacheable and flight.followers == 0 and flight.task is not None and not flight.done:
+            flight.task.cancel()
+
+    async def stream(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Yield text chunks for key from the cache, an in-flight generation, or a new one"""
+        cached = self.get(key)
+        if cached is not None:
+            logger.info("Consultation cache hit, replaying stored summary")
+            for chunk in cached:
+                yield chunk
+            return
+
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = _InFlight()
+            self._in_flight[key] = flight
+            # The generation runs as its own task so it survives the first client disconnecting
+            flight.task = asyncio.create_task(self._generate(key, flight, producer))
+        else:
+            logger.info("Attaching duplicate consultation request to in-flight generation")
+
+        flight.followers += 1
+        try:
+            async for chunk in flight.follow():
+                yield chunk
+        finally:
+            flight.followers -= 1
+            self._cancel_if_abandoned(flight)
+
+    async def _generate(self, key: str, flight: _InFlight, producer: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in producer():
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+            if flight.cacheable:
+                self.put(key, flight.chunks)
+        except Exception as e:
+            logger.error(f"Consultation generation failed: {str(e)}")
+            flight.error = e
+        finally:
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+
+
+def cache_from_env() -> ConsultationCache:
+    return ConsultationCache(
+        ttl_seconds=int(os.getenv("CONSULTATION_CACHE_TTL", "300")),
+        max_entries=int(os.getenv("CONSULTATION_CACHE_MAX_ENTRIES", "1000")),
+        key=os.getenv("CONSULTATION_CACHE_KEY") or None,
+    )
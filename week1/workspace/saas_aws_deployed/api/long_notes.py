@@ -0,0 +1,96 @@
+import re
+import asyncio
+from typing import Dict, List, Optional
+from openai import AsyncOpenAI
+from rate_limit import add_usage
+
+# Rough token estimate; avoids pulling in a tokenizer for a threshold check
+CHARS_PER_TOKEN = 4
+
+# Lines that look like the start of a new section in dictated notes or pasted records
+SECTION_LINE = re.compile(r"^\s*(#+\s|[A-Z][A-Za-z /&()-]{1,40}:\s*$|[A-Z][A-Z /&()-]{2,40}$)")
+
+chunk_system_prompt = """
+You are provided with one part of a long set of notes written by a doctor from a patient's visit.
+Extract every clinically relevant fact from this part: history, findings, medications, results, diagnoses and plans.
+Be concise, keep exact values and dates, and do not invent anything that is not in the notes.
+Reply with a plain bullet list.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _blocks(notes: str) -> List[str]:
+    """Break notes into paragraphs, starting a new block at blank lines and section headings"""
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in notes.splitlines():
+        if not line.strip() or SECTION_LINE.match(line):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            if not line.strip():
+                continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized(block: str, max_chars: int) -> List[str]:
+    # A single paragraph larger than a chunk falls back to sentence, then hard, boundaries
+    pieces: List[str] = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", block):
+        # Flush what we have first so hard-split slices stay in reading order
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_notes(notes: str, chunk_tokens: int) -> List[str]:
+    """Pack paragraphs and sections into chunks of at most chunk_tokens"""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks: List[str] = []
+    current = ""
+    for block in _blocks(notes):
+        parts = [block] if len(block) <= max_chars else _split_oversized(block, max_chars)
+        for part in parts:
+            if current and len(current) + len(part) + 2 > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current}\n\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def summarize_chunks(client: AsyncOpenAI, model: str, chunks: List[str], concurrency: int,
+                           usage: Optional[Dict[str, int]] = None) -> List[str]:
+    """Map step: summarize every chunk concurrently, preserving the original order"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(index: int, chunk: str) -> str:
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": chunk_system_prompt},
+                    {"role": "user", "content": f"Part {index + 1} of {len(chunks)}:\n{chunk}"},
+                ],
+            )
+            if usage is not None:
+                add_usage(usage, response.usage)
+            return response.choices[0].message.content or ""
+
+    return await asyncio.gather(*(summarize(i, c) for i, c in enumerate(chunks)))
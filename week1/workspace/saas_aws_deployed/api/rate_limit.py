@@ -0,0 +1,133 @@
+import os
+import math
+import time
+import importlib
+import threading
+from typing import Dict, Optional
+from fastapi import HTTPException
+
+
+class InMemoryBackend:
+    """Token buckets and usage counters held in this process.
+
+    A shared backend (e.g. Redis) only needs the same four methods; point
+    RATE_LIMIT_BACKEND at a `module:factory` to use it across instances.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def _refill(self, key: str, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        self._buckets[key] = (tokens, now)
+        return tokens
+
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        """Take cost from the bucket; returns 0 on success, otherwise seconds until it would fit"""
+        # A cost above the burst needs a full bucket and leaves it in debt for the excess
+        needed = min(cost, capacity)
+        with self._lock:
+            tokens = self._refill(key, capacity, refill_per_second)
+            if tokens >= needed:
+                self._buckets[key] = (tokens - cost, self._buckets[key][1])
+                return 0.0
+            return (needed - tokens) / refill_per_second
+
+    def adjust(self, key: str, delta: float, capacity: float, refill_per_second: float):
+        """Add (refund) or remove (charge) tokens unconditionally; the bucket may go into debt"""
+        with self._lock:
+            tokens = self._refill(key, capacity, refill_per_second)
+            self._buckets[key] = (min(capacity, tokens + delta), self._buckets[key][1])
+
+    def add_usage(self, user_id: str, counts: Dict[str, int]):
+        with self._lock:
+            usage = self._usage.setdefault(user_id, {})
+            for name, value in counts.items():
+                usage[name] = usage.get(name, 0) + value
+
+    def get_usage(self, user_id: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._usage.get(user_id, {}))
+
+
+class RateLimiter:
+    """Per-user request and model-token buckets for the consultation endpoints"""
+
+    def __init__(self, backend, requests_per_minute: float, request_burst: float,
+                 tokens_per_minute: float, token_burst: float):
+        self.backend = backend
+        self.requests = (request_burst, requests_per_minute / 60)
+        self.tokens = (token_burst, tokens_per_minute / 60)
+
+    def check(self, user_id: str, requests: int, estimated_tokens: int):
+        """Admit a request or raise 429 before anything is sent upstream.
+
+        The estimated prompt tokens are reserved now and settled against
+        the real usage once the completion reports it.
+        """
+        wait = self.backend.take(f"req:{user_id}", requests, *self.requests)
+        if wait == 0:
+            wait = self.backend.take(f"tok:{user_id}", estimated_tokens, *self.tokens)
+            if wait > 0:
+                self.backend.adjust(f"req:{user_id}", requests, *self.requests)
+        if wait > 0:
+            self.backend.add_usage(user_id, {"rejected": requests})
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+        self.backend.add_usage(user_id, {"requests": requests})
+
+    def settle(self, user_id: str, reserved: int, usage: Optional[Dict[str, int]] = None):
+        """Charge actual model usage against the token bucket, net of the reservation"""
+        if not usage:
+            # No usage reported (e.g. a replayed cache hit): give the reservation back
+            self.backend.adjust(f"tok:{user_id}", reserved, *self.tokens)
+            return
+        self.backend.adjust(f"tok:{user_id}", reserved - usage["total_tokens"], *self.tokens)
+        self.backend.add_usage(user_id, usage)
+
+    def report(self, user_id: str) -> dict:
+        usage = self.backend.get_usage(user_id)
+        for name in ("requests", "rejected", "prompt_tokens", "completion_tokens", "total_tokens"):
+            usage.setdefault(name, 0)
+        return {
+            "user_id": user_id,
+            "usage": usage,
+            "limits": {
+                "requests_per_minute": self.requests[1] * 60,
+                "request_burst": self.requests[0],
+                "tokens_per_minute": self.tokens[1] * 60,
+                "token_burst": self.tokens[0],
+            },
+        }
+
+
+def add_usage(totals: Dict[str, int], usage):
+    """Accumulate an OpenAI usage object into a plain dict of token counts"""
+    if usage is None:
+        return
+    for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        totals[name] = totals.get(name, 0) + (getattr(usage, name, 0) or 0)
+
+
+def _load_backend(spec: Optional[str]):
+    if not spec:
+        return InMemoryBackend()
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+def limiter_from_env() -> RateLimiter:
+    return RateLimiter(
+        backend=_load_backend(os.getenv("RATE_LIMIT_BACKEND")),
+        requests_per_minute=float(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "10")),
+        request_burst=float(os.getenv("RATE_LIMIT_REQUEST_BURST", "20")),
+        tokens_per_minute=float(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "40000")),
+        token_burst=float(os.getenv("RATE_LIMIT_TOKEN_BURST", "100000")),
+    )
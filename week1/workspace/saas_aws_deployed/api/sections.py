@@ -0,0 +1,114 @@
+import json
+from typing import List, Optional, Tuple
+
+# The three sections system_prompt asks for, in order: (id, keyword in the heading)
+SECTIONS = [
+    ("summary", "summary"),
+    ("next_steps", "next steps"),
+    ("patient_email", "email"),
+]
+
+# How much text may arrive before the first heading before we call the output malformed
+MAX_PREAMBLE_CHARS = 400
+
+
+class MissingSectionError(Exception):
+    """The model output skipped or never produced one of the required sections"""
+
+
+class SectionParser:
+    """Incrementally split streamed model output into the three consultation sections.
+
+    feed() takes raw text chunks and returns (event, payload) tuples for
+    section_start, delta and section_end. Only a partial line that could
+    still turn out to be a ### heading is buffered; everything else is
+    passed through as soon as it arrives.
+    """
+
+    def __init__(self):
+        self._index = -1
+        self._holding: Optional[str] = None
+        self._at_line_start = True
+        self._preamble_chars = 0
+
+    @property
+    def current(self) -> Optional[str]:
+        return SECTIONS[self._index][0] if self._index >= 0 else None
+
+    def feed(self, text: str) -> List[Tuple[str, dict]]:
+        events: List[Tuple[str, dict]] = []
+        start = 0
+        while start < len(text):
+            newline = text.find("\n", start)
+            end = len(text) if newline == -1 else newline + 1
+            self._consume(text[start:end], newline != -1, events)
+            start = end
+        return events
+
+    def finish(self) -> List[Tuple[str, dict]]:
+        events: List[Tuple[str, dict]] = []
+        if self._holding is not None:
+            held, self._holding = self._holding, None
+            if not self._try_heading(held, events):
+                self._delta(held, events)
+        if self._index < len(SECTIONS) - 1:
+            raise MissingSectionError(f"Output ended without section '{SECTIONS[self._index + 1][0]}'")
+        events.append(("section_end", {"section": self.current}))
+        return events
+
+    def _consume(self, piece: str, complete: bool, events: List[Tuple[str, dict]]):
+        if self._holding is None and not self._at_line_start:
+            self._delta(piece, events)
+            self._at_line_start = complete
+            return
+
+        line = (self._holding or "") + piece
+        self._holding = None
+        head = line.lstrip(" ")
+        if head.startswith("###"):
+            if complete:
+                if not self._try_heading(line, events):
+                    self._delta(line, events)
+            else:
+                self._holding = line
+        elif not complete and "###".startswith(head):
+            # Could still become a heading once the next chunk arrives
+            self._holding = line
+        else:
+            self._delta(line, events)
+            self._at_line_start = complete
+            return
+        self._at_line_start = complete
+
+    def _try_heading(self, line: str, events: List[Tuple[str, dict]]) -> bool:
+        title = line.strip().lstrip("#").strip()
+        lowered = title.lower()
+        for position, (section, keyword) in enumerate(SECTIONS):
+            if keyword in lowered:
+                break
+        else:
+            return False
+
+        if position <= self._index:
+            # A repeated or earlier heading inside a section is just content
+            return False
+        if position != self._index + 1:
+            raise MissingSectionError(f"Section '{SECTIONS[self._index + 1][0]}' was skipped")
+
+        if self._index >= 0:
+            events.append(("section_end", {"section": self.current}))
+        self._index = position
+        events.append(("section_start", {"section": section, "title": title}))
+        return True
+
+    def _delta(self, text: str, events: List[Tuple[str, dict]]):
+        if self._index < 0:
+            self._preamble_chars += len(text.strip())
+            if self._preamble_chars > MAX_PREAMBLE_CHARS:
+                raise MissingSectionError(f"No '{SECTIONS[0][0]}' heading in the first {MAX_PREAMBLE_CHARS} characters")
+            return
+        events.append(("delta", {"section": self.current, "text": text}))
+
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
@@ -1,13 +1,22 @@
 import os
+import json
+import asyncio
 import logging
+from contextlib import aclosing
+from functools import lru_cache
 from pathlib import Path
+from typing import List
 from fastapi import FastAPI, Depends, Request, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from fastapi_clerk_auth import ClerkConfig, ClerkHTTPBearer, HTTPAuthorizationCredentials
-from openai import OpenAI
+from openai import AsyncOpenAI
+from consultation_cache import ConsultationCache, cache_from_env
+from sections import SectionParser, MissingSectionError, sse_event
+from long_notes import estimate_tokens, split_notes, summarize_chunks
+from static_assets import PrecompressedStaticFiles
+from rate_limit import add_usage, limiter_from_env
 import requests
 from starlette.middleware.base import BaseHTTPMiddleware
 
@@ -42,6 +51,19 @@ app.add_middleware(AuthLoggingMiddleware)
 endpoint = "https://poc-arjun-oai.openai.azure.com/openai/v1"
 deployment_name = "gpt-5-nano"
 
+# Batch consultation settings
+BATCH_MAX_VISITS = int(os.getenv("BATCH_MAX_VISITS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Regenerations allowed when structured output is missing a section
+SECTION_MAX_RETRIES = int(os.getenv("SECTION_MAX_RETRIES", "1"))
+
+# Long-input mode: notes above the threshold are summarized in parallel chunks first
+LONG_NOTES_TOKEN_THRESHOLD = int(os.getenv("LONG_NOTES_TOKEN_THRESHOLD", "6000"))
+LONG_NOTES_CHUNK_TOKENS = int(os.getenv("LONG_NOTES_CHUNK_TOKENS", "2000"))
+# Chunks summarized at once; notes longer than concurrency x chunk tokens take extra rounds
+LONG_NOTES_CONCURRENCY = int(os.getenv("LONG_NOTES_CONCURRENCY", "16"))
+
 # Add CORS middleware (allows frontend to call backend)
 app.add_middleware(
     CORSMiddleware,
@@ -112,10 +134,41 @@ Date of Visit: {visit.date_of_visit}
 Notes:
 {visit.notes}"""
 
+def reduce_prompt_for(visit: Visit, chunk_summaries: List[str]) -> str:
+    parts = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(chunk_summaries))
+    return f"""Create the summary, next steps and draft email for:
+Patient Name: {visit.patient_name}
+Date of Visit: {visit.date_of_visit}
+The notes were too long to include in full. Here are extracted facts from each part of the notes, in order:
+{parts}"""
+
+class VisitBatch(BaseModel):
+    visits: List[Visit] = Field(..., min_length=1, max_length=BATCH_MAX_VISITS)
+
+@lru_cache(maxsize=1)
+def get_async_client() -> AsyncOpenAI:
+    """Shared async client so batch requests reuse one connection pool"""
+    return AsyncOpenAI(base_url=endpoint)
+
+# Idempotency cache: resubmitting the same visit replays the stored summary
+consultation_cache = cache_from_env()
+
+# Per-user request and model-token buckets, checked before any upstream call
+rate_limiter = limiter_from_env()
+
+def sse_events(text: str):
+    """Format a chunk of model output as SSE data lines for the frontend"""
+    lines = text.split("\n")
+    for line in lines[:-1]:
+        yield f"data: {line}\n\n"
+        yield "data:  \n"
+    yield f"data: {lines[-1]}\n\n"
+
 @app.post("/api/consultation")
 async def consultation_summary(
     request: Request,
     visit: Visit,
+    sections: bool = False,
     creds: HTTPAuthorizationCredentials = Depends(clerk_guard),
 ):
     # Log authentication details
@@ -133,34 +186,183 @@ async def consultation_summary(
         logger.error(f"Failed to decode JWT credentials: {str(e)}", exc_info=True)
         raise HTTPException(status_code=403, detail="Authentication failed")
     
-    client = OpenAI(base_url=endpoint)
-    
     user_prompt = user_prompt_for(visit)
     prompt = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
+    cache_key = ConsultationCache.make_key(user_id, user_prompt)
+    
+    # Reserve the estimated prompt tokens now; real usage is settled when the stream ends
+    estimated_tokens = estimate_tokens(system_prompt + user_prompt)
+    rate_limiter.check(user_id, 1, estimated_tokens)
+    accounting = {"reserved": estimated_tokens, "started": False, "stream_opened": False}
+    
+    def settle(usage=None):
+        reserved, accounting["reserved"] = accounting["reserved"], 0
+        rate_limiter.settle(user_id, reserved, usage)
+    
+    async def generate():
+        accounting["started"] = True
+        usage = {}
+        try:
+            async for text in stream_completion(usage):
+                yield text
+        finally:
+            if usage or not accounting["stream_opened"]:
+                # Charge what was reported, or refund in full if the upstream call never opened
+                settle(usage)
+            else:
+                # Stream opened but cut short before usage arrived; upstream has billed, so keep the reservation
+                accounting["reserved"] = 0
+    
+    async def stream_completion(usage):
+        client = get_async_client()
+        messages = prompt
+        if estimate_tokens(visit.notes) > LONG_NOTES_TOKEN_THRESHOLD:
+            # Map: summarize the chunks concurrently; only the reduce step is streamed
+            chunks = split_notes(visit.notes, LONG_NOTES_CHUNK_TOKENS)
+            logger.info(f"Long notes for user {user_id}: summarizing {len(chunks)} chunks")
+            chunk_summaries = await summarize_chunks(client, deployment_name, chunks, LONG_NOTES_CONCURRENCY, usage)
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": reduce_prompt_for(visit, chunk_summaries)},
+            ]
+        stream = await client.chat.completions.create(
+            model=deployment_name,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        accounting["stream_opened"] = True
+        try:
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                add_usage(usage, chunk.usage)
+                # Check if chunk has choices before accessing
+                if chunk.choices and len(chunk.choices) > 0:
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        yield text
+        finally:
+            # Closing the response stops upstream generation if we were cancelled
+            await stream.close()
+    
+    async def event_stream():
+        try:
+            async for text in consultation_cache.stream(cache_key, generate):
+                for event in sse_events(text):
+                    yield event
+        except Exception as e:
+            logger.error(f"Streaming error for user {user_id}: {str(e)}")
+            yield f"data: [ERROR]: {str(e)}\n\n"
+        finally:
+            if not accounting["started"]:
+                settle()
     
-    stream = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=prompt,
-        stream=True,
-    )
+    async def section_stream():
+        try:
+            async for event in section_events():
+                yield event
+        finally:
+            if not accounting["started"]:
+                settle()
     
-    def event_stream():
-        for chunk in stream:
-            # Check if chunk has choices before accessing
-            if chunk.choices and len(chunk.choices) > 0:
-                text = chunk.choices[0].delta.content
-                if text:
-                    lines = text.split("\n")
-                    for line in lines[:-1]:
-                        yield f"data: {line}\n\n"
-                        yield "data:  \n"
-                    yield f"data: {lines[-1]}\n\n"
+    async def section_events():
+        # Typed section events; a malformed output is regenerated rather than cached
+        for attempt in range(SECTION_MAX_RETRIES + 1):
+            parser = SectionParser()
+            try:
+                # Close our follower before discard() so an abandoned generation is cancelled
+                async with aclosing(consultation_cache.stream(cache_key, generate)) as chunks:
+                    async for text in chunks:
+                        for event, payload in parser.feed(text):
+                            yield sse_event(event, payload)
+                for event, payload in parser.finish():
+                    yield sse_event(event, payload)
+                yield sse_event("done", {})
+                return
+            except MissingSectionError as e:
+                logger.warning(f"Malformed consultation output for user {user_id} (attempt {attempt + 1}): {str(e)}")
+                consultation_cache.discard(cache_key)
+                if attempt < SECTION_MAX_RETRIES:
+                    yield sse_event("retry", {"attempt": attempt + 1, "reason": str(e)})
+                else:
+                    yield sse_event("error", {"error": str(e)})
+            except Exception as e:
+                logger.error(f"Streaming error for user {user_id}: {str(e)}")
+                yield sse_event("error", {"error": str(e)})
+                return
     
+    if sections:
+        return StreamingResponse(section_stream(), media_type="text/event-stream")
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
+@app.post("/api/consultation/batch")
+async def consultation_batch(
+    batch: VisitBatch,
+    creds: HTTPAuthorizationCredentials = Depends(clerk_guard),
+):
+    """Summarize many visits concurrently and stream NDJSON results in completion order"""
+    try:
+        user_id = creds.decoded["sub"]
+    except Exception as e:
+        logger.error(f"Failed to decode JWT credentials: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=403, detail="Authentication failed")
+
+    logger.info(f"Received batch of {len(batch.visits)} visits from user: {user_id}")
+
+    estimates = [estimate_tokens(system_prompt + user_prompt_for(v)) for v in batch.visits]
+    estimated_tokens = sum(estimates)
+    rate_limiter.check(user_id, len(batch.visits), estimated_tokens)
+    usage = {}
+    # Items sent upstream that haven't reported usage yet; their reservation is kept if cancelled
+    unreported = {}
+
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def summarize(index: int, visit: Visit) -> dict:
+        async with semaphore:
+            unreported[index] = estimates[index]
+            try:
+                response = await client.chat.completions.create(
+                    model=deployment_name,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt_for(visit)},
+                    ],
+                )
+                add_usage(usage, response.usage)
+                unreported.pop(index, None)
+                summary = response.choices[0].message.content if response.choices else None
+                if not summary:
+                    return {"index": index, "status": "error", "error": "Empty response from model"}
+                return {"index": index, "status": "ok", "summary": summary}
+            except Exception as e:
+                unreported.pop(index, None)
+                logger.error(f"Batch item {index} failed for user {user_id}: {str(e)}")
+                return {"index": index, "status": "error", "error": str(e)}
+
+    async def ndjson_stream():
+        tasks = [asyncio.create_task(summarize(i, v)) for i, v in enumerate(batch.visits)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield json.dumps(result) + "\n"
+        finally:
+            # Client disconnected or stream closed early - stop any outstanding work
+            for task in tasks:
+                task.cancel()
+            rate_limiter.settle(user_id, estimated_tokens - sum(unreported.values()), usage)
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+@app.get("/api/usage")
+def usage_report(creds: HTTPAuthorizationCredentials = Depends(clerk_guard)):
+    """Requests and model tokens consumed by the authenticated user"""
+    return rate_limiter.report(creds.decoded["sub"])
+
 @app.get("/health")
 def health_check():
     """Health check endpoint for AWS App Runner"""
@@ -168,12 +370,7 @@ def health_check():
     return {"status": "healthy"}
 
 # Serve static files (our Next.js export) - MUST BE LAST!
+# Assets are precompressed and ETagged once at startup; hashed _next/static files are cached as immutable
 static_path = Path("static")
 if static_path.exists():
-    # Serve index.html for the root path
-    @app.get("/")
-    async def serve_root():
-        return FileResponse(static_path / "index.html")
-    
-    # Mount static files for all other routes
-    app.mount("/", StaticFiles(directory="static", html=True), name="static")
\ No newline at end of file
+    app.mount("/", PrecompressedStaticFiles(directory="static"), name="static")
\ No newline at end of file
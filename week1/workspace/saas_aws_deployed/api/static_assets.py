@@ -0,0 +1,192 @@
+import sys
+import gzip
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # gzip-only if brotli isn't installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Next.js puts content-hashed build output here; those URLs never change content
+IMMUTABLE_PREFIX = "_next/static/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else (HTML, favicon...) must be revalidated, which the ETag makes cheap
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+MIN_COMPRESS_BYTES = 1024
+
+# Preferred order when the client accepts several encodings equally
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(encoding: str, body: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=11)
+    return None
+
+
+class _Asset:
+    def __init__(self, path: Path, relative: str):
+        self.body = path.read_bytes()
+        self.content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if relative.startswith(IMMUTABLE_PREFIX) else REVALIDATE_CACHE_CONTROL
+        digest = hashlib.sha256(self.body).hexdigest()[:20]
+        self.etags = {"identity": f'"{digest}"'}
+        self.encoded: Dict[str, bytes] = {}
+
+        if not _is_compressible(self.content_type) or len(self.body) < MIN_COMPRESS_BYTES:
+            return
+        for encoding, suffix in ENCODINGS:
+            # Prefer files written by precompress() at build time, fall back to compressing now
+            sibling = path.with_name(path.name + suffix)
+            if sibling.exists() and sibling.stat().st_mtime >= path.stat().st_mtime:
+                data = sibling.read_bytes()
+            else:
+                data = _compress(encoding, self.body)
+            if data is not None and len(data) < len(self.body):
+                self.encoded[encoding] = data
+                self.etags[encoding] = f'"{digest}-{encoding}"'
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        if not self.encoded:
+            return "identity"
+        accepted = _parse_accept_encoding(accept_encoding)
+        best, best_q = "identity", 0.0
+        for encoding, _ in ENCODINGS:
+            q = accepted.get(encoding, accepted.get("*", 0.0))
+            if encoding in self.encoded and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+
+def _parse_accept_encoding(value: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(if_none_match: str, etags: List[str]) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+def _source_files(directory: Path):
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file():
+            continue
+        if path.suffix in (".br", ".gz") and path.with_suffix("").exists():
+            continue
+        yield path
+
+
+class PrecompressedStaticFiles:
+    """Serve a static export from memory with precompressed variants.
+
+    Every file is read once at startup along with its gzip/brotli encodings
+    and a content ETag, so requests only negotiate Accept-Encoding and pick
+    bytes. Lookup follows StaticFiles(html=True), plus Next.js-style
+    `/page` -> `page.html`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.assets: Dict[str, _Asset] = {}
+        for path in _source_files(self.directory):
+            relative = path.relative_to(self.directory).as_posix()
+            self.assets[relative] = _Asset(path, relative)
+        compressed = sum(1 for asset in self.assets.values() if asset.encoded)
+        logger.info(f"Loaded {len(self.assets)} static assets ({compressed} precompressed) from {directory}")
+
+    def lookup(self, path: str) -> Tuple[Optional[_Asset], int]:
+        path = path.strip("/")
+        candidates = [path, f"{path}/index.html", f"{path}.html"] if path else ["index.html"]
+        for candidate in candidates:
+            if candidate in self.assets:
+                return self.assets[candidate], 200
+        return self.assets.get("404.html"), 404
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        response = self.get_response(scope)
+        await response(scope, receive, send)
+
+    def get_response(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+
+        asset, status_code = self.lookup(scope["path"][len(scope.get("root_path", "")):])
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        request_headers = Headers(scope=scope)
+        encoding = asset.choose_encoding(request_headers.get("accept-encoding", ""))
+        headers = {"cache-control": asset.cache_control, "etag": asset.etags[encoding]}
+        if asset.encoded:
+            headers["vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get("if-none-match")
+        if status_code == 200 and if_none_match and _etag_matches(if_none_match, [asset.etags[encoding]]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+        body = asset.encoded.get(encoding, asset.body)
+        if scope["method"] == "HEAD":
+            headers["content-length"] = str(len(body))
+            body = b""
+        return Response(body, status_code=status_code, headers=headers, media_type=asset.content_type)
+
+
+def precompress(directory: str):
+    """Write .gz and .br files next to compressible assets (run at image build time)"""
+    written = 0
+    for path in _source_files(Path(directory)):
+        content_type = mimetypes.guess_type(path.name)[0] or ""
+        if not _is_compressible(content_type) or path.stat().st_size < MIN_COMPRESS_BYTES:
+            continue
+        body = path.read_bytes()
+        for encoding, suffix in ENCODINGS:
+            data = _compress(encoding, body)
+            if data is not None and len(data) < len(body):
+                path.with_name(path.name + suffix).write_bytes(data)
+                written += 1
+    print(f"Precompressed {written} files in {directory}")
+
+
+if __name__ == "__main__":
+    precompress(sys.argv[1] if len(sys.argv) > 1 else "static")
@@ -1,13 +1,39 @@
-from resources import linkedin, summary, facts, style
+from resources import DEFAULT_PERSONA, load_resources, persona_dir
+from collections import OrderedDict
 from datetime import datetime
+import os
+import threading
 
 
-full_name = facts["full_name"]
-name = facts["name"]
+# Bounds for the compiled persona contexts kept warm in this container
+PERSONA_CACHE_MAX_ENTRIES = int(os.getenv("PERSONA_CACHE_MAX_ENTRIES", "32"))
+PERSONA_CACHE_MAX_BYTES = int(os.getenv("PERSONA_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
 
 
-def prompt():
-    return f"""
+class PersonaNotFound(Exception):
+    pass
+
+
+class Persona:
+    """A persona's system prompt, compiled once with everything except the current time"""
+
+    def __init__(self, persona_id: str, before_date: str, after_date: str):
+        self.persona_id = persona_id
+        self.before_date = before_date
+        self.after_date = after_date
+        self.size_bytes = len(before_date.encode("utf-8")) + len(after_date.encode("utf-8"))
+
+
+def compile_persona(persona_id: str, resources: dict) -> Persona:
+    facts = resources["facts"]
+    facts_text = resources["facts_text"]
+    summary = resources["summary"]
+    linkedin = resources["linkedin"]
+    style = resources["style"]
+    full_name = facts["full_name"]
+    name = facts["name"]
+
+    before_date = f"""
 # Your Role
 
 You are an AI Agent that is acting as a digital twin of {full_name}, who goes by {name}.
@@ -18,7 +44,7 @@ you are described on the website as the Digital Twin of {name} and you should pr
 ## Important Context
 
 Here is some basic information about {name}:
-{facts}
+{facts_text}
 
 Here are summary notes from {name}:
 {summary}
@@ -31,7 +57,8 @@ Here are some notes from {name} about their communications style:
 
 
 For reference, here is the current date and time:
-{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+"""
+    after_date = f"""
 
 ## Your task
 
@@ -55,4 +82,66 @@ There are 3 critical rules that you must follow:
 
 Please engage with the user.
 Avoid responding in a way that feels like a chatbot or AI assistant, and don't end every message with a question; channel a smart conversation with an engaging person, a true reflection of {name}.
-"""
\ No newline at end of file
+"""
+    return Persona(persona_id, before_date, after_date)
+
+
+class PersonaCache:
+    """LRU of compiled personas, bounded by entry count and by total prompt bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._personas: "OrderedDict[str, Persona]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, persona_id: str) -> Persona:
+        with self._lock:
+            persona = self._personas.get(persona_id)
+            if persona is not None:
+                self._personas.move_to_end(persona_id)
+                self.hits += 1
+                return persona
+            self.misses += 1
+
+        data_dir = persona_dir(persona_id)
+        if data_dir is None:
+            raise PersonaNotFound(persona_id)
+        persona = compile_persona(persona_id, load_resources(data_dir))
+
+        with self._lock:
+            if persona_id not in self._personas:
+                self._personas[persona_id] = persona
+                self._bytes += persona.size_bytes
+            # Always keep the persona just requested, even if it alone exceeds the byte budget
+            while len(self._personas) > 1 and (
+                len(self._personas) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._personas.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+                self.evictions += 1
+        return persona
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "personas": list(self._personas),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+persona_cache = PersonaCache(PERSONA_CACHE_MAX_ENTRIES, PERSONA_CACHE_MAX_BYTES)
+
+
+def prompt(persona_id: str = DEFAULT_PERSONA):
+    persona = persona_cache.get(persona_id)
+    return persona.before_date + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + persona.after_date
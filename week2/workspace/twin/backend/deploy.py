@@ -54,6 +54,10 @@ def main():
     if os.path.exists("data"):
         shutil.copytree("data", "lambda-package/data")
 
+    # Copy additional personas (one folder per twin)
+    if os.path.exists("personas"):
+        shutil.copytree("personas", "lambda-package/personas")
+
     # Create zip
     print("Creating zip file...")
     with zipfile.ZipFile("lambda-deployment.zip", "w", zipfile.ZIP_DEFLATED) as zipf:
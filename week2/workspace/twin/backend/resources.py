@@ -1,23 +1,213 @@
 from pypdf import PdfReader
+from collections import Counter
+import argparse
 import json
+import os
+import re
+import sys
 
-# Read LinkedIn PDF
-try:
-    reader = PdfReader("./data/linkedin.pdf")
-    linkedin = ""
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            linkedin += text
-except FileNotFoundError:
-    linkedin = "LinkedIn profile not available"
-
-# Read other data files
-with open("./data/summary.txt", "r", encoding="utf-8") as f:
-    summary = f.read()
-
-with open("./data/style.txt", "r", encoding="utf-8") as f:
-    style = f.read()
-
-with open("./data/facts.json", "r", encoding="utf-8") as f:
-    facts = json.load(f)
\ No newline at end of file
+# The original single persona lives in ./data; additional personas get a folder each
+DEFAULT_PERSONA = os.getenv("DEFAULT_PERSONA", "default")
+PERSONAS_DIR = os.getenv("PERSONAS_DIR", "./personas")
+
+# Persona IDs come from URLs and host names, so only allow safe directory names
+PERSONA_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+def persona_dir(persona_id: str):
+    """Return the data directory for a persona, or None if it doesn't exist"""
+    if persona_id == DEFAULT_PERSONA:
+        return "./data"
+    if not PERSONA_ID_PATTERN.match(persona_id):
+        return None
+    path = os.path.join(PERSONAS_DIR, persona_id)
+    return path if os.path.isdir(path) else None
+
+
+# Rough token estimate (about 4 characters per token), enough to track prompt bloat
+CHARS_PER_TOKEN = 4
+
+# How many lines at the top and bottom of a page can hold a running header or footer
+EDGE_LINES = 2
+
+PAGE_NUMBER_LINE = re.compile(r"^page \d+( of \d+)?$", re.IGNORECASE)
+
+# LinkedIn lines shorter than this (cities, dates, "(LinkedIn)") are kept even if repeated elsewhere
+MIN_DEDUP_CHARS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9@.]+", " ", text.lower()).split())
+
+
+def _edge_slots(page: list) -> dict:
+    """Map line index -> (position, text) for the first and last EDGE_LINES lines of a page"""
+    slots = {}
+    for offset in range(min(EDGE_LINES, len(page))):
+        slots[offset] = (offset, page[offset])
+        slots[len(page) - 1 - offset] = (-1 - offset, page[-1 - offset])
+    return slots
+
+
+def clean_pdf_pages(pages: list) -> str:
+    """Strip page headers/footers, rejoin wrapped and hyphenated lines, collapse whitespace"""
+    page_lines = []
+    for page in pages:
+        cleaned = (" ".join(line.replace("\xa0", " ").split()) for line in page.splitlines())
+        page_lines.append([line for line in cleaned if line])
+
+    # A running header/footer sits in the same edge slot (first or last lines) on most pages
+    repeated = set()
+    if len(page_lines) >= 3:
+        counts = Counter(slot for page in page_lines for slot in set(_edge_slots(page).values()))
+        repeated = {slot for slot, count in counts.items() if count >= 0.6 * len(page_lines)}
+
+    lines = []
+    for page in page_lines:
+        edges = {index for index, slot in _edge_slots(page).items() if slot in repeated}
+        for index, line in enumerate(page):
+            if index in edges or PAGE_NUMBER_LINE.match(line):
+                continue
+            if lines and (line[0].islower() or lines[-1][-1] in ",(/&-\u00ad" or lines[-1].count("(") > lines[-1].count(")")):
+                # Soft wrap from the PDF layout: glue it back onto the previous line
+                if lines[-1].endswith("\u00ad"):
+                    # Only a soft hyphen is a pure line-break artifact
+                    lines[-1] = lines[-1][:-1] + line
+                elif lines[-1].endswith("-") and lines[-1][-2:-1].isalnum():
+                    # A visible hyphen belongs to a compound word ("high-performance", "Co-founder")
+                    lines[-1] = lines[-1] + line
+                else:
+                    lines[-1] = f"{lines[-1]} {line}"
+            else:
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def dedupe_lines(text: str, *references: str) -> str:
+    """Drop lines already stated in the reference texts.
+
+    Repeats within text itself are kept: a résumé legitimately lists the
+    same job title under different roles.
+    """
+    reference = " ".join(_normalize(r) for r in references)
+    kept = []
+    dropped = None
+    for line in text.splitlines():
+        key = _normalize(line)
+        if len(key) >= MIN_DEDUP_CHARS and key in reference:
+            dropped = key
+            continue
+        if dropped and f"{dropped} {key}" in reference:
+            # The tail of a duplicate that the PDF wrapped onto its own line
+            dropped = f"{dropped} {key}"
+            continue
+        dropped = None
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def render_facts(facts: dict) -> str:
+    """Render facts as compact `key: value` lines instead of a Python dict repr"""
+    lines = []
+    for key, value in facts.items():
+        label = key.replace("_", " ")
+        if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            lines.append(f"{label}:")
+            lines.extend("- " + ", ".join(str(v) for v in item.values()) for item in value)
+        elif isinstance(value, list):
+            lines.append(f"{label}: " + "; ".join(str(item) for item in value))
+        elif isinstance(value, dict):
+            lines.append(f"{label}: " + ", ".join(f"{k}: {v}" for k, v in value.items()))
+        else:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+def list_personas() -> list:
+    """The default persona plus every valid persona directory under PERSONAS_DIR"""
+    personas = [DEFAULT_PERSONA]
+    if os.path.isdir(PERSONAS_DIR):
+        personas += sorted(
+            name for name in os.listdir(PERSONAS_DIR)
+            if PERSONA_ID_PATTERN.match(name) and os.path.isdir(os.path.join(PERSONAS_DIR, name))
+        )
+    return personas
+
+
+def load_resources(data_dir: str) -> dict:
+    """Read the LinkedIn PDF, summary, style and facts for one persona, trimmed for the prompt"""
+    # Read LinkedIn PDF
+    try:
+        reader = PdfReader(os.path.join(data_dir, "linkedin.pdf"))
+        pages = [text for text in (page.extract_text() for page in reader.pages) if text]
+        raw_linkedin = "".join(pages)
+        linkedin = clean_pdf_pages(pages)
+    except FileNotFoundError:
+        raw_linkedin = linkedin = "LinkedIn profile not available"
+
+    # Read other data files
+    with open(os.path.join(data_dir, "summary.txt"), "r", encoding="utf-8") as f:
+        summary = f.read()
+
+    with open(os.path.join(data_dir, "style.txt"), "r", encoding="utf-8") as f:
+        style = f.read()
+
+    with open(os.path.join(data_dir, "facts.json"), "r", encoding="utf-8") as f:
+        facts = json.load(f)
+
+    facts_text = render_facts(facts)
+    # Summary and facts are hand-written, so LinkedIn is the source that gives way
+    linkedin = dedupe_lines(linkedin, summary, facts_text)
+
+    token_report = {
+        "facts": (estimate_tokens(str(facts)), estimate_tokens(facts_text)),
+        "summary": (estimate_tokens(summary), estimate_tokens(summary)),
+        "linkedin": (estimate_tokens(raw_linkedin), estimate_tokens(linkedin)),
+        "style": (estimate_tokens(style), estimate_tokens(style)),
+    }
+
+    return {
+        "linkedin": linkedin,
+        "summary": summary,
+        "style": style,
+        "facts": facts,
+        "facts_text": facts_text,
+        "token_report": token_report,
+    }
+
+
+def main():
+    """Print per-source token counts; fail when a persona's context exceeds the budget (for CI)"""
+    parser = argparse.ArgumentParser(description="Report prompt token usage of persona resources")
+    parser.add_argument("personas", nargs="*", help="Persona IDs (default: all)")
+    parser.add_argument("--max-tokens", type=int, default=int(os.getenv("PROMPT_TOKEN_BUDGET", "0")),
+                        help="Fail if a persona's trimmed resources exceed this many tokens")
+    args = parser.parse_args()
+
+    personas = args.personas or list_personas()
+    failed = False
+    for persona_id in personas:
+        data_dir = persona_dir(persona_id)
+        if data_dir is None:
+            print(f"{persona_id}: not found")
+            failed = True
+            continue
+        report = load_resources(data_dir)["token_report"]
+        print(f"\n{persona_id}\n{'source':<10}{'before':>8}{'after':>8}{'saved':>8}")
+        for source, (before, after) in report.items():
+            print(f"{source:<10}{before:>8}{after:>8}{before - after:>8}")
+        total_before = sum(b for b, _ in report.values())
+        total_after = sum(a for _, a in report.values())
+        print(f"{'total':<10}{total_before:>8}{total_after:>8}{total_before - total_after:>8}")
+        if args.max_tokens and total_after > args.max_tokens:
+            print(f"{persona_id}: {total_after} tokens exceeds budget of {args.max_tokens}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
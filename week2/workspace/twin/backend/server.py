@@ -1,15 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 from typing import Optional, List, Dict
 import json
+import re
 import uuid
 from datetime import datetime
 import boto3
 from botocore.exceptions import ClientError
-from context import prompt
+from context import prompt, persona_cache, PersonaNotFound
+from resources import DEFAULT_PERSONA, persona_dir
 
 # Load environment variables
 load_dotenv()
@@ -67,16 +69,25 @@ class Message(BaseModel):
     timestamp: str
 
 
+# Session IDs become storage keys, so they must not contain path separators
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
 # Memory management functions
-def get_memory_path(session_id: str) -> str:
-    return f"{session_id}.json"
+def get_memory_path(session_id: str, persona_id: str = DEFAULT_PERSONA) -> str:
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id")
+    # The default persona keeps the original flat layout so existing sessions still load
+    if persona_id == DEFAULT_PERSONA:
+        return f"{session_id}.json"
+    return f"{persona_id}/{session_id}.json"
 
 
-def load_conversation(session_id: str) -> List[Dict]:
+def load_conversation(session_id: str, persona_id: str = DEFAULT_PERSONA) -> List[Dict]:
     """Load conversation history from storage"""
     if USE_S3:
         try:
-            response = s3_client.get_object(Bucket=S3_BUCKET, Key=get_memory_path(session_id))
+            response = s3_client.get_object(Bucket=S3_BUCKET, Key=get_memory_path(session_id, persona_id))
             return json.loads(response["Body"].read().decode("utf-8"))
         except ClientError as e:
             if e.response["Error"]["Code"] == "NoSuchKey":
@@ -84,31 +95,31 @@ def load_conversation(session_id: str) -> List[Dict]:
             raise
     else:
         # Local file storage
-        file_path = os.path.join(MEMORY_DIR, get_memory_path(session_id))
+        file_path = os.path.join(MEMORY_DIR, get_memory_path(session_id, persona_id))
         if os.path.exists(file_path):
             with open(file_path, "r") as f:
                 return json.load(f)
         return []
 
 
-def save_conversation(session_id: str, messages: List[Dict]):
+def save_conversation(session_id: str, messages: List[Dict], persona_id: str = DEFAULT_PERSONA):
     """Save conversation history to storage"""
     if USE_S3:
         s3_client.put_object(
             Bucket=S3_BUCKET,
-            Key=get_memory_path(session_id),
+            Key=get_memory_path(session_id, persona_id),
             Body=json.dumps(messages, indent=2),
             ContentType="application/json",
         )
     else:
         # Local file storage
-        os.makedirs(MEMORY_DIR, exist_ok=True)
-        file_path = os.path.join(MEMORY_DIR, get_memory_path(session_id))
+        file_path = os.path.join(MEMORY_DIR, get_memory_path(session_id, persona_id))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, "w") as f:
             json.dump(messages, f, indent=2)
 
 
-def call_bedrock(conversation: List[Dict], user_message: str) -> str:
+def call_bedrock(conversation: List[Dict], user_message: str, persona_id: str = DEFAULT_PERSONA) -> str:
     """Call AWS Bedrock with conversation history"""
     
     # Build messages in Bedrock format
@@ -117,7 +128,7 @@ def call_bedrock(conversation: List[Dict], user_message: str) -> str:
     # Add system prompt as first user message (Bedrock convention)
     messages.append({
         "role": "user", 
-        "content": [{"text": f"System: {prompt()}"}]
+        "content": [{"text": f"System: {prompt(persona_id)}"}]
     })
     
     # Add conversation history (limit to last 10 exchanges to manage context)
@@ -162,6 +173,18 @@ def call_bedrock(conversation: List[Dict], user_message: str) -> str:
             raise HTTPException(status_code=500, detail=f"Bedrock error: {str(e)}")
 
 
+def resolve_persona(request: Request, persona_id: Optional[str] = None) -> str:
+    """Pick the persona from the URL path, then the host's subdomain, then the default"""
+    if persona_id is not None:
+        if persona_dir(persona_id) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown persona: {persona_id}")
+        return persona_id
+    subdomain = request.headers.get("host", "").split(":")[0].split(".")[0].lower()
+    if subdomain and subdomain != DEFAULT_PERSONA and persona_dir(subdomain) is not None:
+        return subdomain
+    return DEFAULT_PERSONA
+
+
 @app.get("/")
 async def root():
     return {
@@ -177,21 +200,31 @@ async def health_check():
     return {
         "status": "healthy", 
         "use_s3": USE_S3,
-        "bedrock_model": BEDROCK_MODEL_ID
+        "bedrock_model": BEDROCK_MODEL_ID,
+        "persona_cache": persona_cache.stats()
     }
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
+    return handle_chat(request, resolve_persona(http_request))
+
+
+@app.post("/personas/{persona_id}/chat", response_model=ChatResponse)
+async def persona_chat(persona_id: str, request: ChatRequest, http_request: Request):
+    return handle_chat(request, resolve_persona(http_request, persona_id))
+
+
+def handle_chat(request: ChatRequest, persona_id: str) -> ChatResponse:
     try:
         # Generate session ID if not provided
         session_id = request.session_id or str(uuid.uuid4())
 
         # Load conversation history
-        conversation = load_conversation(session_id)
+        conversation = load_conversation(session_id, persona_id)
 
         # Call Bedrock for response
-        assistant_response = call_bedrock(conversation, request.message)
+        assistant_response = call_bedrock(conversation, request.message, persona_id)
 
         # Update conversation history
         conversation.append(
@@ -206,23 +239,37 @@ async def chat(request: ChatRequest):
         )
 
         # Save conversation
-        save_conversation(session_id, conversation)
+        save_conversation(session_id, conversation, persona_id)
 
         return ChatResponse(response=assistant_response, session_id=session_id)
 
     except HTTPException:
         raise
+    except PersonaNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown persona: {persona_id}")
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/conversation/{session_id}")
-async def get_conversation(session_id: str):
+async def get_conversation(session_id: str, http_request: Request):
     """Retrieve conversation history"""
+    return read_conversation(session_id, resolve_persona(http_request))
+
+
+@app.get("/personas/{persona_id}/conversation/{session_id}")
+async def get_persona_conversation(persona_id: str, session_id: str, http_request: Request):
+    """Retrieve conversation history for a specific persona"""
+    return read_conversation(session_id, resolve_persona(http_request, persona_id))
+
+
+def read_conversation(session_id: str, persona_id: str):
     try:
-        conversation = load_conversation(session_id)
-        return {"session_id": session_id, "messages": conversation}
+        conversation = load_conversation(session_id, persona_id)
+        return {"session_id": session_id, "persona_id": persona_id, "messages": conversation}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
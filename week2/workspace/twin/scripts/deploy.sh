@@ -8,6 +8,9 @@ echo "🚀 Deploying ${PROJECT_NAME} to ${ENVIRONMENT}..."
 
 # 1. Build Lambda package
 cd "$(dirname "$0")/.."        # project root
+echo "📏 Checking persona prompt size..."
+# Fails the deploy if any persona's resources exceed the budget (~1900 tokens today); override with PROMPT_TOKEN_BUDGET
+(cd backend && uv run resources.py --max-tokens "${PROMPT_TOKEN_BUDGET:-2500}")
 echo "📦 Building Lambda package..."
 (cd backend && uv run deploy.py)
 
@@ -190,6 +190,18 @@ resource "aws_apigatewayv2_route" "post_chat" {
   target    = "integrations/${aws_apigatewayv2_integration.lambda.id}"
 }
 
+resource "aws_apigatewayv2_route" "post_persona_chat" {
+  api_id    = aws_apigatewayv2_api.main.id
+  route_key = "POST /personas/{persona_id}/chat"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda.id}"
+}
+
+resource "aws_apigatewayv2_route" "get_persona_conversation" {
+  api_id    = aws_apigatewayv2_api.main.id
+  route_key = "GET /personas/{persona_id}/conversation/{session_id}"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda.id}"
+}
+
 resource "aws_apigatewayv2_route" "get_health" {
   api_id    = aws_apigatewayv2_api.main.id
   route_key = "GET /health"